@@ -1,60 +1,175 @@
+import functools
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+import altair as alt
 import seaborn as sns
 import streamlit as st
 from babel.numbers import format_currency
 
-# Function to load data from CSV and convert specific columns to datetime format
+DATA_PATH = './data/all_data.csv'
+PARQUET_PATH = './data/all_data.parquet'
+DATE_COLUMNS = ['order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date',
+                'order_delivered_customer_date', 'order_estimated_delivery_date']
+DTYPES = {'order_id': 'string', 'customer_id': 'string', 'order_status': 'category',
+          'product_category_name_english': 'category', 'customer_state': 'category',
+          'payment_value': 'float32', 'price': 'float32', 'freight_value': 'float32',
+          'zip_code_prefix_x': 'int32', 'geolocation_lat_x': 'float32', 'geolocation_lng_x': 'float32',
+          'geolocation_lat_y': 'float32', 'geolocation_lng_y': 'float32'}
+# Stored as '1.0' in the CSV, so they can only be narrowed to integers after parsing
+INT_DTYPES = {'qty_order': 'int32', 'review_score': 'int8', 'payment_sequential': 'int8',
+              'payment_installments': 'int8', 'apply_time': 'int16', 'shipped_time': 'int16',
+              'customer_gets_order': 'int16', 'estimated_range': 'int16', 'range_order': 'int16',
+              'zip_code_prefix_y': 'int32'}
+# Columns used by the charts and metrics; the rest are only shown in the raw data table
+ANALYSIS_COLUMNS = ['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp', 'qty_order',
+                    'price', 'freight_value', 'payment_value', 'review_score',
+                    'product_category_name_english', 'customer_state']
+# Maximum number of points drawn in the price/freight scatter plot
+SCATTER_SAMPLE_SIZE = 10_000
+# Vega number locale matching Babel's pt_BR currency formatting
+BRL_NUMBER_LOCALE = {'number': {'decimal': ',', 'thousands': '.', 'grouping': [3], 'currency': ['R$ ', '']}}
+
+
+# Function to format a value as Brazilian Real, memoized for repeated axis ticks
+@functools.lru_cache(maxsize=1024)
+def format_brl(value):
+    """
+    Format a number as a Brazilian Real currency string. Babel parses the locale pattern
+    on every call, so results are cached.
+    
+    Args:
+        value (float): The value to format.
+    
+    Returns:
+        str: The formatted currency string.
+    """
+    return format_currency(value, 'BRL', locale='pt_BR')
+
+
+# Function to create a matplotlib tick formatter for Brazilian Real values
+def brl_formatter():
+    """
+    Create a tick formatter that labels axis values as Brazilian Real.
+    
+    Returns:
+        FuncFormatter: The tick formatter.
+    """
+    return plt.FuncFormatter(lambda x, p: format_brl(round(x, 2)))
+
+
+# Function to convert the CSV data into a typed Parquet file
+def convert_to_parquet():
+    """
+    Convert the CSV data into a Parquet file with the column types and datetime columns
+    already parsed.
+    """
+    df = pd.read_csv(DATA_PATH, dtype=DTYPES, parse_dates=DATE_COLUMNS).astype(INT_DTYPES)
+    # Write to a temporary file first, so an interrupted write never leaves a truncated
+    # Parquet file that looks newer than the CSV
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(PARQUET_PATH), suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_path, engine='pyarrow', compression='zstd')
+        os.replace(tmp_path, PARQUET_PATH)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# Function to load data from the Parquet file, converting the CSV first if needed
+@st.cache_data(show_spinner=False)
 def load_data():
     """
-    Load and preprocess the data from a CSV file.
+    Load the data from the Parquet file, (re)building it from the CSV when it is missing
+    or older than the CSV, sorted by purchase timestamp. The result is cached by Streamlit,
+    so the file is only read once instead of on every rerun.
     
     Returns:
         DataFrame: Processed DataFrame with datetime columns.
     """
-    df = pd.read_csv('./data/all_data.csv')
-    date_columns = ['order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date',
-                    'order_delivered_customer_date', 'order_estimated_delivery_date']
-    for column in date_columns:
-        df[column] = pd.to_datetime(df[column])
+    if not os.path.exists(PARQUET_PATH) or os.path.getmtime(PARQUET_PATH) < os.path.getmtime(DATA_PATH):
+        convert_to_parquet()
+    # Enforce the expected types, so a Parquet file written with an older schema still loads
+    # correctly; this copies the listed columns, but only once per cold (uncached) load
+    df = pd.read_parquet(PARQUET_PATH, engine='pyarrow').astype({**DTYPES, **INT_DTYPES})
+    # Keep the rows in purchase order so date ranges can be sliced with searchsorted
+    df = df.sort_values('order_purchase_timestamp', kind='mergesort').reset_index(drop=True)
     return df
 
 
+# Function to create a per-status daily orders dataframe over the full data
+@st.cache_data(show_spinner=False)
+def create_status_daily_orders(_df):
+    """
+    Create a DataFrame that aggregates the number of unique orders per order status and
+    day over the full data. The result is cached by Streamlit, so the aggregation runs
+    once and reruns only slice it.
+    
+    Args:
+        _df (DataFrame): The full input DataFrame (not hashed by Streamlit).
+    
+    Returns:
+        DataFrame: Daily order data indexed by order status and purchase date.
+    """
+    # With one row per order, counting unique orders is just counting rows
+    orders = _df.drop_duplicates('order_id')[['order_id', 'order_purchase_timestamp', 'order_status']]
+    status_daily_orders = orders.groupby(
+        ['order_status', pd.Grouper(key='order_purchase_timestamp', freq='D')], sort=False, observed=True
+    ).agg({
+        'order_id': 'size'
+    }).sort_index()
+    return status_daily_orders
+
+
 # Function to create a daily orders dataframe based on purchase timestamp
-def create_daily_orders(df):
+def create_daily_orders(df, start_date, end_date, selected_status):
     """
-    Create a DataFrame that aggregates the number of unique orders and total payment
-    values on a daily basis.
+    Create a DataFrame that aggregates the number of unique orders on a daily basis for
+    the selected date range and order status.
     
     Args:
-        df (DataFrame): The input DataFrame.
+        df (DataFrame): The full input DataFrame.
+        start_date (datetime.date): The start date for filtering.
+        end_date (datetime.date): The end date for filtering.
+        selected_status (str): The selected order status to filter.
     
     Returns:
         DataFrame: Aggregated daily order data.
     """
-    daily_orders = df.resample(rule='D', on='order_purchase_timestamp').agg({
-        'order_id': 'nunique',
-        'payment_value': 'sum'
-    }).reset_index()
+    status_daily_orders = create_status_daily_orders(df)
+    if selected_status != 'ALL':
+        daily_orders = status_daily_orders.xs(selected_status, level='order_status')
+    else:
+        # Every order has a single status, so the per-status counts add up
+        daily_orders = status_daily_orders.groupby(level='order_purchase_timestamp').sum()
+
+    daily_orders = daily_orders.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+    daily_orders = daily_orders.groupby(pd.Grouper(freq='D')).sum().reset_index()
     return daily_orders
 
 
 # Function to create a monthly orders dataframe based on purchase timestamp
-def create_monthly_orders(df):
+def create_monthly_orders(df, start_date, end_date, selected_status):
     """
-    Create a DataFrame that aggregates the number of unique orders and total payment
-    values on a monthly basis.
+    Create a DataFrame that aggregates the number of unique orders on a monthly basis for
+    the selected date range and order status.
     
     Args:
-        df (DataFrame): The input DataFrame.
+        df (DataFrame): The full input DataFrame.
+        start_date (datetime.date): The start date for filtering.
+        end_date (datetime.date): The end date for filtering.
+        selected_status (str): The selected order status to filter.
     
     Returns:
         DataFrame: Aggregated monthly order data.
     """
-    monthly_orders = df.resample(rule='M', on='order_purchase_timestamp').agg({
-        'order_id': 'nunique',
-        'payment_value': 'sum'
-    }).reset_index()
+    # Every order has a single purchase date, so the daily counts add up to monthly ones
+    daily_orders = create_daily_orders(df, start_date, end_date, selected_status)
+    monthly_orders = daily_orders.groupby(pd.Grouper(key='order_purchase_timestamp', freq='MS')).sum().reset_index()
     return monthly_orders
 
 
@@ -87,12 +202,15 @@ def create_sidebar(df):
 
 
 # Function to filter data based on the selected date range and order status
-def filter_data(df, start_date, end_date, selected_status):
+@st.cache_resource(max_entries=8, show_spinner=False)
+def filter_data(_df, start_date, end_date, selected_status):
     """
-    Filter the data based on the selected date range and order status.
+    Filter the data based on the selected date range and order status. Results are cached
+    per filter selection and shared as-is, so callers must not modify the returned frame.
     
     Args:
-        df (DataFrame): The input DataFrame to be filtered.
+        _df (DataFrame): The full input DataFrame to be filtered, sorted by purchase timestamp
+            (not hashed by Streamlit).
         start_date (datetime.date): The start date for filtering.
         end_date (datetime.date): The end date for filtering.
         selected_status (str): The selected order status to filter.
@@ -100,11 +218,17 @@ def filter_data(df, start_date, end_date, selected_status):
     Returns:
         DataFrame: The filtered DataFrame based on user input.
     """
-    filtered_df = df[(df["order_purchase_timestamp"].dt.date >= start_date) &
-                     (df["order_purchase_timestamp"].dt.date <= end_date)]
+    # The data is sorted by purchase timestamp, so the date range is a contiguous slice
+    bounds = np.array([np.datetime64(start_date), np.datetime64(end_date) + np.timedelta64(1, 'D')],
+                      dtype='datetime64[ns]')
+    start, end = np.searchsorted(_df['order_purchase_timestamp'].values, bounds)
+    filtered_df = _df.iloc[start:end]
 
     if selected_status != 'ALL':
         filtered_df = filtered_df[filtered_df['order_status'] == selected_status]
+    else:
+        # The slice is a view that would keep this rerun's full copy of the data alive in the cache
+        filtered_df = filtered_df.copy()
 
     return filtered_df
 
@@ -120,7 +244,7 @@ def create_best_worst_categories(df):
     Returns:
         DataFrame: Aggregated product category data sorted by quantity ordered.
     """
-    category_summary = df.groupby('product_category_name_english')['qty_order'].sum().reset_index()
+    category_summary = df.groupby('product_category_name_english', sort=False, observed=True)['qty_order'].sum().reset_index()
     return category_summary
 
 
@@ -136,14 +260,23 @@ def create_rfm_analysis(df):
         DataFrame: RFM analysis results with customer IDs and their corresponding RFM values.
     """
     now = df['order_purchase_timestamp'].max()
-    rfm_df = df.groupby('customer_id').agg({
-        'order_purchase_timestamp': lambda x: (now - x.max()).days,
-        'order_id': 'count',
-        'payment_value': 'sum'
-    }).reset_index()
-
-    rfm_df.columns = ['customer_id', 'recency', 'frequency', 'monetary']
-    rfm_df['numeric_id'] = pd.factorize(rfm_df['customer_id'])[0] + 1
+
+    # Factorize the customers once and reduce every metric over the same group codes
+    codes, customer_ids = pd.factorize(df['customer_id'], sort=False)
+    timestamps = df['order_purchase_timestamp'].values
+    last_purchase = np.full(len(customer_ids), np.iinfo(np.int64).min)
+    np.maximum.at(last_purchase, codes, timestamps.view('i8'))
+
+    rfm_df = pd.DataFrame({
+        'customer_id': customer_ids,
+        'recency': (now.to_datetime64() - last_purchase.view(timestamps.dtype))
+                   .astype('timedelta64[D]').astype(np.int32),
+        'frequency': np.bincount(codes, minlength=len(customer_ids)).astype(np.int32),
+        'monetary': np.bincount(codes, weights=df['payment_value'].values, minlength=len(customer_ids))
+    })
+
+    # Each customer appears once after grouping, so the ids are simply 1..N
+    rfm_df['numeric_id'] = np.arange(1, len(rfm_df) + 1, dtype=np.int32)
     return rfm_df
 
 
@@ -158,49 +291,44 @@ def create_geoanalysis(df):
     Returns:
         DataFrame: Sales data aggregated by customer state.
     """
-    sales_by_state = df.groupby('customer_state')['payment_value'].sum().sort_values(ascending=True)
+    sales_by_state = df.groupby('customer_state', sort=False, observed=True)['payment_value'].sum().sort_values(ascending=True)
     return sales_by_state
 
 
 # Function to display a monthly sales chart
-def display_monthly_sales(df):
+def display_monthly_sales(df, start_date, end_date, selected_status):
     """
     Generate and display a monthly sales chart in the Streamlit app.
     
     Args:
-        df (DataFrame): The input DataFrame containing the order data.
+        df (DataFrame): The full input DataFrame containing the order data.
+        start_date (datetime.date): The start date for filtering.
+        end_date (datetime.date): The end date for filtering.
+        selected_status (str): The selected order status to filter.
     """
-    monthly_orders = create_monthly_orders(df)
+    monthly_orders = create_monthly_orders(df, start_date, end_date, selected_status)
     st.subheader('Monthly Sales Chart')
 
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(monthly_orders['order_purchase_timestamp'], monthly_orders['order_id'])
-    plt.title('Monthly Sales Count')
-    plt.xlabel('Date')
-    plt.ylabel('Sales Count (R$)')
-    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format_currency(x, 'BRL', locale='pt_BR')))
-
-    st.pyplot(fig)
+    st.line_chart(monthly_orders, x='order_purchase_timestamp', y='order_id',
+                  x_label='Date', y_label='Sales Count')
 
 
 # Function to display a daily sales chart
-def display_daily_sales(df):
+def display_daily_sales(df, start_date, end_date, selected_status):
     """
     Generate and display a daily sales chart in the Streamlit app.
     
     Args:
-        df (DataFrame): The input DataFrame containing the order data.
+        df (DataFrame): The full input DataFrame containing the order data.
+        start_date (datetime.date): The start date for filtering.
+        end_date (datetime.date): The end date for filtering.
+        selected_status (str): The selected order status to filter.
     """
-    daily_orders = create_daily_orders(df)
+    daily_orders = create_daily_orders(df, start_date, end_date, selected_status)
     st.subheader('Daily Sales Chart')
 
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(daily_orders['order_purchase_timestamp'], daily_orders['order_id'])
-    plt.title('Daily Sales Count')
-    plt.xlabel('Date')
-    plt.ylabel('Sales Count')
-
-    st.pyplot(fig)
+    st.line_chart(daily_orders, x='order_purchase_timestamp', y='order_id',
+                  x_label='Date', y_label='Sales Count')
 
 
 # Function to display top 5 best and worst product categories
@@ -216,14 +344,16 @@ def display_best_worst_categories(df):
     fig, ax = plt.subplots(nrows=2, ncols=1, figsize=(16, 12))
     colors = ["#72BCD4"] * 5
 
-    sns.barplot(x='qty_order', y='product_category_name_english',
-                data=category_summary.sort_values(by='qty_order', ascending=False).head(5),
-                palette=colors, ax=ax[0])
+    best_categories = category_summary.nlargest(5, 'qty_order')
+    worst_categories = category_summary.nsmallest(5, 'qty_order')
+
+    # Pass the order explicitly, otherwise seaborn draws every level of the categorical column
+    sns.barplot(x='qty_order', y='product_category_name_english', data=best_categories,
+                order=best_categories['product_category_name_english'], palette=colors, ax=ax[0])
     ax[0].set_title('Top 5 Best-Selling Categories', fontsize=15)
 
-    sns.barplot(x='qty_order', y='product_category_name_english',
-                data=category_summary.sort_values(by='qty_order', ascending=True).head(5),
-                palette=colors, ax=ax[1])
+    sns.barplot(x='qty_order', y='product_category_name_english', data=worst_categories,
+                order=worst_categories['product_category_name_english'], palette=colors, ax=ax[1])
     ax[1].set_title('Top 5 Worst-Selling Categories', fontsize=15)
 
     st.subheader('Top 5 Best and Worst-Selling Categories by Quantity Ordered')
@@ -243,15 +373,15 @@ def display_rfm_analysis(df):
     fig, ax = plt.subplots(nrows=1, ncols=3, figsize=(30, 6))
     colors = ['#72BCD4'] * 5
 
-    sns.barplot(y="recency", x='numeric_id', data=rfm_df.sort_values(by='recency', ascending=True).head(5), palette=colors, ax=ax[0])
+    sns.barplot(y="recency", x='numeric_id', data=rfm_df.nsmallest(5, 'recency'), palette=colors, ax=ax[0])
     ax[0].set_title('Recency (days)', fontsize=18)
 
-    sns.barplot(y='frequency', x='numeric_id', data=rfm_df.sort_values(by='frequency', ascending=False).head(5), palette=colors, ax=ax[1])
+    sns.barplot(y='frequency', x='numeric_id', data=rfm_df.nlargest(5, 'frequency'), palette=colors, ax=ax[1])
     ax[1].set_title('Purchase Frequency', fontsize=18)
 
-    sns.barplot(y='monetary', x='numeric_id', data=rfm_df.sort_values(by='monetary', ascending=False).head(5), palette=colors, ax=ax[2])
+    sns.barplot(y='monetary', x='numeric_id', data=rfm_df.nlargest(5, 'monetary'), palette=colors, ax=ax[2])
     ax[2].set_title('Total Monetary Value', fontsize=18)
-    ax[2].yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format_currency(x, 'BRL', locale='pt_BR')))
+    ax[2].yaxis.set_major_formatter(brl_formatter())
 
     st.subheader('Best Customers Based on RFM Analysis')
     st.pyplot(fig)
@@ -268,15 +398,11 @@ def display_geoanalysis(df):
     sales_by_state = create_geoanalysis(df)
     st.subheader('Sales by State')
 
-    fig, ax = plt.subplots(figsize=(12, 6))
-    sales_by_state.plot(kind='barh', ax=ax)
-    plt.title('Sales by State')
-    plt.ylabel('State')
-    plt.xlabel('Total Sales')
-    plt.tight_layout()
-    ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format_currency(x, 'BRL', locale='pt_BR')))
-
-    st.pyplot(fig)
+    chart = alt.Chart(sales_by_state.reset_index()).mark_bar().encode(
+        x=alt.X('payment_value', title='Total Sales', axis=alt.Axis(format='$,.2f')),
+        y=alt.Y('customer_state', title='State', sort='-x')
+    ).configure(locale=BRL_NUMBER_LOCALE)
+    st.altair_chart(chart)
 
 
 # Function to display clustering analysis based on price, freight, and review score
@@ -289,16 +415,34 @@ def display_clustering(df):
     """
     st.subheader('Relationship between Price, Freight Cost, and Review Score')
 
-    fig, ax = plt.subplots(figsize=(14, 8))
-    scatter = ax.scatter(df['price'], df['freight_value'], c=df['review_score'], cmap='viridis', alpha=0.5)
-    plt.colorbar(scatter, label='Review Score')
-
-    plt.xlabel('Product Price')
-    ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format_currency(x, 'BRL', locale='pt_BR')))
-    plt.ylabel('Freight Cost')
-    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format_currency(x, 'BRL', locale='pt_BR')))
+    # A random sample looks the same as the full cloud but is far cheaper to render
+    sample = df.sample(min(len(df), SCATTER_SAMPLE_SIZE), random_state=0)
+
+    # Build the figure once per session and only swap the points on reruns
+    if 'clustering_chart' not in st.session_state:
+        # Not created through pyplot, so the figure is freed with the session state
+        fig = Figure(figsize=(14, 8))
+        ax = fig.subplots()
+        scatter = ax.scatter(sample['price'], sample['freight_value'], c=sample['review_score'], cmap='viridis', alpha=0.5)
+        fig.colorbar(scatter, ax=ax, label='Review Score')
+
+        ax.set_xlabel('Product Price')
+        ax.xaxis.set_major_formatter(brl_formatter())
+        ax.set_ylabel('Freight Cost')
+        ax.yaxis.set_major_formatter(brl_formatter())
+
+        ax.set_title('Price vs Freight Cost vs Review Score')
+        st.session_state['clustering_chart'] = (fig, ax, scatter)
+    else:
+        fig, ax, scatter = st.session_state['clustering_chart']
+        scatter.set_offsets(np.column_stack([sample['price'], sample['freight_value']]))
+        scatter.set_array(sample['review_score'].to_numpy())
+        scatter.autoscale()
+        # relim() ignores collections, so rebuild the data limits from the new points
+        ax.ignore_existing_data_limits = True
+        ax.update_datalim(scatter.get_offsets())
+        ax.autoscale_view()
 
-    plt.title('Price vs Freight Cost vs Review Score')
     st.pyplot(fig)
 
 
@@ -313,13 +457,14 @@ def display_order_stats(df):
     col1, col2 = st.columns(2)
 
     total_orders = df['order_id'].nunique()
-    total_revenue = df['payment_value'].sum()
+    # Accumulate in float64 so the float32 column still sums to the exact cents
+    total_revenue = df['payment_value'].astype('float64').sum()
 
     with col1:
         st.metric('Total Orders', total_orders)
 
     with col2:
-        formatted_revenue = format_currency(total_revenue, 'BRL', locale='pt_BR')
+        formatted_revenue = format_brl(total_revenue)
         st.metric('Total Revenue', formatted_revenue)
 
 
@@ -332,13 +477,12 @@ def display_order_status_viz(df):
         df (DataFrame): The input DataFrame containing order status data.
     """
     st.subheader('Orders by Status')
-    order_count = df['order_status'].value_counts()
-    fig, ax = plt.subplots(figsize=(10, 6))
-    order_count.plot(kind='bar', ax=ax)
-    plt.title('Orders by Status')
-    plt.xlabel('Order Status')
-    plt.ylabel('Order Count')
-    st.pyplot(fig)
+    # Count the categorical codes directly instead of hashing the status labels
+    statuses = df['order_status'].cat.categories
+    counts = np.bincount(df['order_status'].cat.codes.to_numpy(), minlength=len(statuses))
+    order_count = pd.Series(counts, index=statuses).sort_values(ascending=False)
+    order_count = order_count[order_count > 0]
+    st.bar_chart(order_count, x_label='Order Status', y_label='Order Count', sort=False)
 
 
 # Function to display raw order data
@@ -369,17 +513,18 @@ def main():
 
     # Filter data based on user input
     filtered_data = filter_data(all_data, start_date, end_date, selected_status)
+    analysis_data = filtered_data[ANALYSIS_COLUMNS]
 
     # Visualization and analysis
     st.subheader(f'Data Visualization for Status: {selected_status}')
-    display_order_stats(filtered_data)
-    display_monthly_sales(filtered_data)
-    display_daily_sales(filtered_data)
-    display_best_worst_categories(filtered_data)
-    display_rfm_analysis(filtered_data)
-    display_order_status_viz(filtered_data)
-    display_geoanalysis(filtered_data)
-    display_clustering(filtered_data)
+    display_order_stats(analysis_data)
+    display_monthly_sales(all_data, start_date, end_date, selected_status)
+    display_daily_sales(all_data, start_date, end_date, selected_status)
+    display_best_worst_categories(analysis_data)
+    display_rfm_analysis(analysis_data)
+    display_order_status_viz(analysis_data)
+    display_geoanalysis(analysis_data)
+    display_clustering(analysis_data)
     display_order_data(filtered_data)
 
 